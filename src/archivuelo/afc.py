@@ -1,12 +1,14 @@
+from .hashing import DEFAULT_HASH_TYPE, new_hasher
+from .pack import Pack
 from pymobiledevice3.services.afc import AfcService as pymobiledevice3_AfcService
 from pymobiledevice3.services.afc import MAXIMUM_READ_SIZE
 from re import Pattern
-from typing import Callable, Optional
+from typing import BinaryIO, Callable, Optional
+import io
 import logging
 import os
 import pathlib
 import posixpath
-import xxhash
 
 logger = logging.getLogger(__name__)
 
@@ -22,7 +24,8 @@ class AfcService(pymobiledevice3_AfcService):
         dst: str,
         match: Optional[Pattern] = None,
         callback: Optional[Callable] = None,
-        src_dir: str = ''
+        src_dir: str = '',
+        hash_type: str = DEFAULT_HASH_TYPE,
     ) -> None:
             """
             Adapted pull() to include a hashing operation and exclude progress output
@@ -34,23 +37,10 @@ class AfcService(pymobiledevice3_AfcService):
                 if os.path.isdir(dst):
                     dst = os.path.join(dst, os.path.basename(relative_src))
                 with open(dst, 'wb') as f:
-                    hash = xxhash.xxh3_64()
-                    src_size = self.stat(src)['st_size']
-                    if src_size <= MAXIMUM_READ_SIZE:
-                        chunk = self.get_file_contents(src)
-                        f.write(chunk)
-                        hash.update(chunk)
-                    else:
-                        left_size = src_size
-                        handle = self.fopen(src)
-                        chunk = self.fread(handle, min(MAXIMUM_READ_SIZE, left_size))
-                        f.write(chunk)
-                        hash.update(chunk)
-                        left_size -= MAXIMUM_READ_SIZE
-                        self.fclose(handle)
+                    hash, size = self._write_with_hash(src, f, hash_type)
                 os.utime(dst, (os.stat(dst).st_atime, self.stat(src)['st_mtime'].timestamp()))
                 if callback is not None:
-                    callback(src, dst, { 'type': 'xxh3_64', 'value': hash.hexdigest() })
+                    callback(src, dst, { 'type': hash_type, 'value': hash.hexdigest() }, size=size)
             else:
                 # directory
                 dst_path = pathlib.Path(dst) / os.path.basename(relative_src)
@@ -67,7 +57,55 @@ class AfcService(pymobiledevice3_AfcService):
 
                     if self.isdir(src_filename):
                         dst_filename.mkdir(exist_ok=True)
-                        self.pull(src_filename, str(dst_path), callback=callback)
+                        self.pull(src_filename, str(dst_path), callback=callback, hash_type=hash_type)
                         continue
 
-                    self.pull(src_filename, str(dst_path), callback=callback)
\ No newline at end of file
+                    self.pull(src_filename, str(dst_path), callback=callback, hash_type=hash_type)
+
+    def pull_into(
+        self,
+        relative_src: str,
+        pack: Pack,
+        callback: Optional[Callable] = None,
+        src_dir: str = '',
+        hash_type: str = DEFAULT_HASH_TYPE,
+    ) -> None:
+            """
+            Pull a single file as a new member of a Pack.
+            Callback receives the offset of the member's data and the number of bytes pulled.
+            """
+            src = self.resolve_path(posixpath.join(src_dir, relative_src))
+            # Members are small by definition, buffer so the tar header can carry the pulled size
+            buffer = io.BytesIO()
+            hash, size = self._write_with_hash(src, buffer, hash_type)
+            buffer.seek(0)
+            offset = pack.add(posixpath.basename(src), buffer, size, self.stat(src)['st_mtime'].timestamp())
+            if callback is not None:
+                callback(src, pack.name, { 'type': hash_type, 'value': hash.hexdigest() }, offset=offset, size=size)
+
+    def _write_with_hash(self, src: str, f: BinaryIO, hash_type: str = DEFAULT_HASH_TYPE):
+        """
+        Read src from the device in chunks, writing each to f and hashing it in the same pass.
+        Returns the hasher and the number of bytes written, which may differ from a size stat'ed earlier.
+        """
+        src_size = self.stat(src)['st_size']
+        hash = new_hasher(hash_type, src_size)
+        size = 0
+        if src_size <= MAXIMUM_READ_SIZE:
+            chunk = self.get_file_contents(src)
+            f.write(chunk)
+            hash.update(chunk)
+            size += len(chunk)
+        else:
+            left_size = src_size
+            handle = self.fopen(src)
+            while left_size > 0:
+                chunk = self.fread(handle, min(MAXIMUM_READ_SIZE, left_size))
+                if not chunk:
+                    break
+                f.write(chunk)
+                hash.update(chunk)
+                size += len(chunk)
+                left_size -= len(chunk)
+            self.fclose(handle)
+        return hash, size
@@ -1,5 +1,9 @@
+from .utils import get_asset_basename, get_asset_primary_rank
+from playhouse.migrate import SqliteMigrator, migrate
+from typing import Dict, List, Optional
 import peewee as pw
 import logging
+import posixpath
 
 logger = logging.getLogger(__name__)
 logging.getLogger('peewee').setLevel(logging.INFO) # Quieten peewee logger
@@ -22,13 +26,35 @@ class BaseModel(pw.Model):
         database = db
 
 
+class TrackedAsset(BaseModel):
+    """
+    Group of related files transferred as a single unit.
+    Cache loads assets with their files prefetched into the files backref.
+    """
+    id = pw.AutoField(primary_key=True)
+    basename = pw.TextField()
+    dirpath_src = pw.TextField()
+
+    class Meta:
+        indexes = (
+            (('dirpath_src', 'basename'), True),
+        )
+
+    @property
+    def primary(self) -> Optional['TrackedMediaFile']:
+        """The file an asset is filtered on, e.g. the HEIC of a Live Photo"""
+        return min(self.files, key=lambda media_file: (get_asset_primary_rank(media_file.filename), media_file.filename), default=None)
+
+
 class TrackedMediaFile(BaseModel):
     id = pw.AutoField(primary_key=True)
+    asset = pw.ForeignKeyField(TrackedAsset, backref='files', null=True, default=None)
     filename = pw.TextField()
     filepath_dst = pw.TextField(null=True, default=None)
     filepath_src = pw.TextField()
     hash_type = pw.TextField(null=True, default=None)
     hash_value = pw.FixedCharField(null=True)
+    pack_offset = pw.IntegerField(null=True, default=None)
     size = pw.IntegerField()
     status_imported = pw.BooleanField(default=False, null=True)
     status_verified = pw.BooleanField(default=False, null=True)
@@ -45,52 +71,135 @@ class Cache:
     def _init_db(self):
         self.db = db
         self.db.connect(reuse_if_open=True)
+        self._migrate_db()
         self.db.create_tables(tables, safe=True)
+        self._assign_assets_to_ungrouped_files()
 
-    def get_files_pending(self, force_all: bool=False):
+    def _migrate_db(self):
         """
-        Look up files scanned but not yet imported
+        Add columns introduced after an existing database was created.
+        Runs before create_tables(), which would otherwise create indexes on columns not yet present.
         """
-        # Get all files if force_all is defined
-        condition = ( TrackedMediaFile.status_imported == False ) if not force_all else ( None )
+        table_name = TrackedMediaFile._meta.table_name
+        if not self.db.table_exists(table_name):
+            return
+        columns = [ c.name for c in self.db.get_columns(table_name) ]
+        migrator = SqliteMigrator(self.db)
+        if 'pack_offset' not in columns:
+            logger.debug(f"Migrating: adding column pack_offset to {table_name}")
+            migrate(migrator.add_column(table_name, 'pack_offset', pw.IntegerField(null=True, default=None)))
+        if 'asset_id' not in columns:
+            logger.debug(f"Migrating: adding column asset_id to {table_name}")
+            migrate(migrator.add_column(table_name, 'asset_id', pw.ForeignKeyField(TrackedAsset, field=TrackedAsset.id, null=True, default=None, index=False)))
+
+    def _assign_assets_to_ungrouped_files(self):
+        """Group files tracked before assets existed"""
         query = ( TrackedMediaFile
             .select(TrackedMediaFile)
-            .where(condition)
+            .where(TrackedMediaFile.asset.is_null())
         )
-        if query:
-            return list(query)
-        else:
-            logger.debug("No files pending")
-            return list()
+        groups = {}
+        for media_file in query:
+            key = ( posixpath.dirname(media_file.filepath_src), get_asset_basename(media_file.filepath_src) )
+            groups.setdefault(key, []).append(media_file)
+        if not groups:
+            return
+        logger.debug(f"Migrating: grouping {len(groups)} assets from ungrouped files")
+        with self.db.atomic():
+            for (dirpath_src, basename), media_files in groups.items():
+                asset, _ = TrackedAsset.get_or_create(dirpath_src=dirpath_src, basename=basename)
+                ( TrackedMediaFile
+                    .update(asset=asset)
+                    .where(TrackedMediaFile.id.in_([ media_file.id for media_file in media_files ]))
+                    .execute()
+                )
+
+    def get_assets_pending(self, force_all: bool=False) -> List[TrackedAsset]:
+        """
+        Look up assets with any file scanned but not yet imported, with all of their files loaded
+        """
+        # Get all assets if force_all is defined
+        query = TrackedAsset.select(TrackedAsset)
+        if not force_all:
+            query = query.where(TrackedAsset.id.in_(
+                TrackedMediaFile
+                    .select(TrackedMediaFile.asset)
+                    .where(TrackedMediaFile.status_imported == False)
+            ))
+        assets = pw.prefetch(
+            query.order_by(TrackedAsset.dirpath_src, TrackedAsset.basename),
+            TrackedMediaFile.select(TrackedMediaFile).order_by(TrackedMediaFile.filename),
+        )
+        assets = [ asset for asset in assets if asset.files ]
+        if not assets:
+            logger.debug("No assets pending")
+        return assets
 
     def get_file_from_id(self, id):
         """Look up file from ID"""
         pass
 
-    def get_file_from_filepath(self, filepath) -> TrackedMediaFile:
-        """Look up file in cache from a device filepath"""
-        return ( TrackedMediaFile
+    def get_files_from_filepaths(self, filepaths: List[str]) -> Dict[str, TrackedMediaFile]:
+        """Look up several files in cache from device filepaths, keyed by filepath"""
+        query = ( TrackedMediaFile
             .select(TrackedMediaFile)
-            .where(TrackedMediaFile.filepath_src == filepath)
-            .get_or_none()
+            .where(TrackedMediaFile.filepath_src.in_(filepaths))
         )
+        return { media_file.filepath_src: media_file for media_file in query }
 
     def num_files(self) -> int:
         return TrackedMediaFile.select().count()
+
+    def num_files_packed(self) -> int:
+        return TrackedMediaFile.select().where(TrackedMediaFile.pack_offset.is_null(False)).count()
     
     def reset_imported_status_on_all_files(self):
         query = TrackedMediaFile.update(status_imported=False)
         return query.execute()
 
     def reset_cache(self):
-        return self.db.drop_tables(TrackedMediaFile)
+        return self.db.drop_tables(tables)
     
     def add(self, **params):
         media_file = TrackedMediaFile(**params)
         media_file.save()
         return media_file
 
+    def add_asset(self, dirpath_src: str, basename: str, media_files: List[TrackedMediaFile], new_files_params: List[dict]) -> TrackedAsset:
+        """
+        Track an asset from its already tracked files and newly found files, in one transaction.
+        Returns the asset with its files loaded into the files backref.
+        """
+        media_files = list(media_files)
+        asset_ids = { media_file.asset_id for media_file in media_files }
+        # Already fully tracked, nothing to write
+        if not new_files_params and len(asset_ids) == 1 and None not in asset_ids:
+            asset = TrackedAsset(id=asset_ids.pop(), dirpath_src=dirpath_src, basename=basename)
+            asset.files = media_files
+            return asset
+        with self.db.atomic():
+            asset_id = next(( asset_id for asset_id in asset_ids if asset_id is not None ), None)
+            if asset_id is not None:
+                asset = TrackedAsset(id=asset_id, dirpath_src=dirpath_src, basename=basename)
+            else:
+                asset, _ = TrackedAsset.get_or_create(dirpath_src=dirpath_src, basename=basename)
+            for media_file in media_files:
+                if media_file.asset_id != asset.id:
+                    media_file.asset = asset
+                    media_file.save()
+            for params in new_files_params:
+                media_files.append(self.add(asset=asset, **params))
+        asset.files = media_files
+        return asset
+
+    def save_files(self, media_files: List[TrackedMediaFile]):
+        """Commit several files, e.g. those pulled for an asset, in one transaction"""
+        with self.db.atomic():
+            for media_file in media_files:
+                media_file.save()
+
 
 tables = (
+    TrackedAsset,
     TrackedMediaFile,
 )
\ No newline at end of file
@@ -1,13 +1,17 @@
 from .cache import Cache, TrackedMediaFile
 from .device import Device
 from .filters import FileFilterTimeAfter, FileFilterTimeBefore
+from .hashing import COLLISION_SAFE_BITS, DEFAULT_HASH_TYPE, ENGINES, benchmark, is_supported
 from .importer import Importer
+from .pack import PACK_FILENAME, extract_pack
+from .services import VERIFICATION_CHUNK_SIZE
 from importlib.metadata import version
 from pymobiledevice3.exceptions import PyMobileDevice3Exception
 from tqdm.asyncio import tqdm
 import asyncio
 import click
 import logging
+import tarfile
 
 logger = logging.getLogger('archivuelo')
 
@@ -86,6 +90,9 @@ def scan( ctx, clear_db, reset_import_status, **options):
     cache: Cache = Cache()
     if clear_db:
         click.echo("Clear the database of scanned media files.\n    (This does not affect any media files, neither on a device nor on disk.)")
+        num_files_packed = cache.num_files_packed()
+        if num_files_packed:
+            click.echo(f"    {num_files_packed} imported files are stored in packs ({PACK_FILENAME}). Packs remain on disk as tar archives,\n    extractable with 'archivuelo extract' or any tar tool, but their index and verification hashes will be lost.")
         if click.confirm("Proceed to clear the database?"):
             click.echo("Clearing database...")
             cache.reset_cache()
@@ -110,7 +117,9 @@ def scan( ctx, clear_db, reset_import_status, **options):
 @click.option('--exclude-after', help="Exclude all files with creation time after this date (YYYY-MM-DD) or time (YYYY-MM-DD HH:MM:SS)")
 @click.option('--exclude-before', help="Exclude all files with creation time before this date (YYYY-MM-DD) or time (YYYY-MM-DD HH:MM:SS)")
 @click.option('--force-all', is_flag=True, default=False, help="Import all files, even if marked as imported previously")
+@click.option('--hash-type', default=DEFAULT_HASH_TYPE, show_default=True, help=f"Hash to record and verify with: {', '.join(ENGINES)}, or several joined by '+' to compute them in one read (e.g. xxh3_64+xxh3_128)")
 @click.option('--overwrite', is_flag=True, default=False, help="Overwrite existing files on disk")
+@click.option('--pack-below', type=int, default=None, help="Pack files smaller than this size (bytes) into a single container per directory, instead of writing each to disk")
 @click.option('--use-cache', is_flag=True, help="Don't scan the device and perform import only using already tracked items")
 def import_(ctx, target_dir, **options):
     # Pre-parse dates into datetime objects
@@ -125,10 +134,52 @@ def import_(ctx, target_dir, **options):
                 ctx.exit(1)
             options['exclude_filters'].append(filter)
             options.pop(cli_option)
+    if not is_supported(options['hash_type']):
+        logger.error(f'Invalid hash type for option --hash-type: \"{options["hash_type"]}\". Available: {", ".join(ENGINES)}. Aborting.')
+        ctx.exit(1)
     # Establish
     device = get_device(ctx)
     importer = Importer()
     # Import
     asyncio.run(
         importer.import_(device, target_dir, **options)
-    )
\ No newline at end of file
+    )
+
+@archivuelo.command()
+@click.pass_context
+@click.argument('pack_file')
+@click.argument('target_dir')
+@click.option('--member', default=None, help="Extract only the file with this name")
+def extract(ctx, pack_file, target_dir, member):
+    """
+    Extract files from a pack into a directory.
+    """
+    try:
+        names = extract_pack(pack_file, target_dir, member)
+    except (OSError, tarfile.TarError) as e:
+        logger.error(f'Unable to extract pack {pack_file}: {e}')
+        ctx.exit(1)
+    if member and not names:
+        logger.error(f'No file named \"{member}\" in pack {pack_file}')
+        ctx.exit(1)
+    logger.info(f'Extracted {len(names)} files to {target_dir}')
+
+@archivuelo.command(name='benchmark')
+@click.pass_context
+@click.option('--size', type=click.IntRange(min=1), default=256, show_default=True, help="Amount of data to hash per algorithm (MiB)")
+@click.option('--chunk-size', type=click.IntRange(min=1), default=VERIFICATION_CHUNK_SIZE // 1024, show_default=True, help="Amount of data per hash update (KiB), defaults to the read size used when verifying")
+@click.option('--hash-type', 'hash_types', multiple=True, help="Hash type to benchmark, may be repeated. Defaults to all available")
+def benchmark_(ctx, size, chunk_size, hash_types):
+    """
+    Measure hash throughput on this machine, to choose a --hash-type for import.
+    """
+    for hash_type in hash_types:
+        if not is_supported(hash_type):
+            logger.error(f'Invalid hash type for option --hash-type: \"{hash_type}\". Available: {", ".join(ENGINES)}. Aborting.')
+            ctx.exit(1)
+    results = benchmark(chunk_size * 1024, list(hash_types) or None, size=size * 1024 * 1024)
+    for result in results:
+        click.echo(f"{result['hash_type']:<24} {result['bits']:>4}-bit  {result['mib_per_second']:>10.1f} MiB/s")
+    collision_safe = [ result for result in results if result['bits'] >= COLLISION_SAFE_BITS ]
+    if collision_safe:
+        click.echo(f"Fastest collision-safe (>= {COLLISION_SAFE_BITS}-bit): {collision_safe[0]['hash_type']}")
@@ -1,4 +1,6 @@
 from .afc import AfcService
+from .hashing import DEFAULT_HASH_TYPE
+from .utils import get_asset_basename
 from pymobiledevice3.exceptions import *
 from pymobiledevice3.lockdown import create_using_usbmux
 import logging
@@ -25,19 +27,34 @@ class Device:
         logger.info(f"Connected to device: {self.device_info_string}")
         return True
 
-    def get_media_files(self, input_path):
+    def get_media_assets(self, input_path):
+        """
+        Group files sharing a basename within each directory, yields (dirpath, basename, filepaths)
+        """
         for root, dirs, files in self.afc.walk(input_path):
+            groups = {}
             for filepath in sorted(files):
-                yield posixpath.join(root, filepath)
+                groups.setdefault(get_asset_basename(filepath), []).append(posixpath.join(root, filepath))
+            for basename, filepaths in groups.items():
+                yield root, basename, filepaths
     
-    def pull_file(self, filepath_src, filepath_dst, callback):
+    def pull_file(self, filepath_src, filepath_dst, callback, hash_type=DEFAULT_HASH_TYPE):
         try:
             logger.debug(f"Pulling file FROM path {filepath_src} TO path {filepath_dst}")
-            self.afc.pull(filepath_src, filepath_dst, callback=callback)
+            self.afc.pull(filepath_src, filepath_dst, callback=callback, hash_type=hash_type)
             return True
         except AfcException as e:
             logger.error(f'Error while pulling file FROM path {filepath_src} TO path {filepath_dst}', exc_info=e)
             return False
 
+    def pull_file_into_pack(self, filepath_src, pack, callback, hash_type=DEFAULT_HASH_TYPE):
+        try:
+            logger.debug(f"Pulling file FROM path {filepath_src} INTO pack {pack.name}")
+            self.afc.pull_into(filepath_src, pack, callback=callback, hash_type=hash_type)
+            return True
+        except AfcException as e:
+            logger.error(f'Error while pulling file FROM path {filepath_src} INTO pack {pack.name}', exc_info=e)
+            return False
+
     def stat(self, filepath, **options):
         return self.afc.os_stat(filepath, **options)
@@ -0,0 +1,136 @@
+from typing import Callable, Dict, List
+import logging
+import os
+import time
+import xxhash
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HASH_TYPE = 'xxh3_64'
+# Combined hash types are engine names joined by '+', their digests joined by ':'
+HASH_TYPE_SEPARATOR = '+'
+HASH_VALUE_SEPARATOR = ':'
+# Digests shorter than this are not considered collision-safe for large archives
+COLLISION_SAFE_BITS = 128
+# BLAKE3 only benefits from multiple threads on larger inputs
+BLAKE3_MULTITHREAD_ABOVE = 16 * 1024 * 1024 # bytes
+
+
+class HashEngine:
+    """A single hash algorithm, identified by the name stored in TrackedMediaFile.hash_type"""
+
+    def __init__(self, name: str, bits: int, factory: Callable):
+        """
+        param factory: called with the size of the file about to be hashed (or None), returns a new hasher
+        """
+        self.name = name
+        self.bits = bits
+        self.factory = factory
+
+    def new(self, size: int=None):
+        return self.factory(size)
+
+    def __str__(self):
+        return f"{self.name} ({self.bits}-bit)"
+
+
+class MultiHasher:
+    """Compute several digests from a single read pass"""
+
+    def __init__(self, hashers: list):
+        self.hashers = hashers
+
+    def update(self, chunk: bytes):
+        for hasher in self.hashers:
+            hasher.update(chunk)
+
+    def hexdigest(self) -> str:
+        return HASH_VALUE_SEPARATOR.join( hasher.hexdigest() for hasher in self.hashers )
+
+
+def _new_blake3(size: int=None):
+    if size is not None and size >= BLAKE3_MULTITHREAD_ABOVE:
+        return blake3.blake3(max_threads=blake3.blake3.AUTO)
+    return blake3.blake3()
+
+
+ENGINES: Dict[str, HashEngine] = {
+    'xxh3_64': HashEngine('xxh3_64', 64, lambda size: xxhash.xxh3_64()),
+    'xxh3_128': HashEngine('xxh3_128', 128, lambda size: xxhash.xxh3_128()),
+}
+if blake3 is not None:
+    ENGINES['blake3'] = HashEngine('blake3', 256, _new_blake3)
+
+
+def get_engines(hash_type: str) -> List[HashEngine]:
+    """
+    Look up the engines making up a hash_type, e.g. 'xxh3_64' or 'xxh3_64+blake3'
+    """
+    names = hash_type.split(HASH_TYPE_SEPARATOR) if hash_type else []
+    unknown = [ name for name in names if name not in ENGINES ]
+    if not names or unknown:
+        raise ValueError(f"Unrecognised hash type: {hash_type}. Available: {', '.join(ENGINES)}")
+    return [ ENGINES[name] for name in names ]
+
+
+def is_supported(hash_type: str) -> bool:
+    try:
+        get_engines(hash_type)
+        return True
+    except ValueError:
+        return False
+
+
+def get_bits(hash_type: str) -> int:
+    """Digest size of the strongest engine in a hash_type"""
+    return max( engine.bits for engine in get_engines(hash_type) )
+
+
+def new_hasher(hash_type: str, size: int=None):
+    """
+    Create a hasher with update() and hexdigest() for a hash_type.
+    Combined hash types return a MultiHasher, so all digests come from the same read.
+    """
+    engines = get_engines(hash_type)
+    if len(engines) == 1:
+        return engines[0].new(size)
+    return MultiHasher([ engine.new(size) for engine in engines ])
+
+
+def benchmark(chunk_size: int, hash_types: List[str]=None, size: int=256 * 1024 * 1024, rounds: int=3) -> List[dict]:
+    """
+    Time each hash type over the same random data, fastest first.
+    param chunk_size: bytes per update(), pass the importer's read size (services.VERIFICATION_CHUNK_SIZE)
+        as multithreaded engines such as BLAKE3 scale with update size
+    """
+    if chunk_size < 1:
+        raise ValueError(f"Chunk size must be at least 1 byte, was: {chunk_size}")
+    if hash_types is None:
+        hash_types = list(ENGINES)
+    chunk = os.urandom(chunk_size)
+    num_chunks = max(1, size // chunk_size)
+    total_bytes = num_chunks * chunk_size
+    results = []
+    for hash_type in hash_types:
+        best = None
+        for _ in range(rounds):
+            hasher = new_hasher(hash_type, total_bytes)
+            start = time.perf_counter()
+            for _ in range(num_chunks):
+                hasher.update(chunk)
+            hasher.hexdigest()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        logger.debug(f"Benchmark {hash_type}: {total_bytes} bytes in {best:.4f}s")
+        results.append(dict(
+            hash_type=hash_type,
+            bits=get_bits(hash_type),
+            seconds=best,
+            mib_per_second=(total_bytes / (1024 * 1024)) / best if best else float('inf'),
+        ))
+    return sorted(results, key=lambda result: result['seconds'])
@@ -1,6 +1,8 @@
-from .cache import Cache, TrackedMediaFile
+from .cache import Cache, TrackedAsset, TrackedMediaFile
 from .device import Device
 from .filters import FileFilter
+from .hashing import DEFAULT_HASH_TYPE
+from .pack import is_pack_member_on_disk
 from .services import CopyService, VerifyService
 from .utils import ProgressBar
 from datetime import datetime
@@ -26,36 +28,38 @@ class Importer:
         self.copy_service.verify_queue = self.verify_service.queue
         self.verify_service.copy_queue = self.copy_service.queue
 
-    def scan(self, device: Device) -> Generator[TrackedMediaFile, None, None]:
-        # As we identify files, check if they are tracked
+    def scan(self, device: Device) -> Generator[TrackedAsset, None, None]:
+        # As we identify assets, check if their files are tracked
         # And then queue them for copy, and apply any specified conditions
         logger.debug(f"Starting")
         count_scanned_files = 0 # Temporary
         count_tracked_files = 0
         count_untracked_files = 0
-        for filepath in tqdm(
-            device.get_media_files(MEDIA_FILEPATH),
+        for dirpath, basename, filepaths in tqdm(
+            device.get_media_assets(MEDIA_FILEPATH),
             desc="Scanning",
-            unit=" files",
+            unit=" assets",
         ):
-            count_scanned_files += 1
-            media_file = self.cache.get_file_from_filepath(filepath)
-            if media_file:
-                count_tracked_files += 1
-                # Already cached - progress callback to display "found # tracked files"
-                pass
-            else:
+            count_scanned_files += len(filepaths)
+            tracked_files = self.cache.get_files_from_filepaths(filepaths)
+            count_tracked_files += len(tracked_files)
+            new_files_params = []
+            for filepath in filepaths:
+                if filepath in tracked_files:
+                    # Already cached - progress callback to display "found # tracked files"
+                    continue
                 # Not yet cached, establish some basics about it
                 stat = device.stat(filepath)
-                media_file = self.cache.add(
+                new_files_params.append(dict(
                     filename=os.path.basename(filepath),
                     filepath_src=filepath,
                     size=stat.st_size,
                     time_birthtime=stat.st_birthtime,
                     time_mtime=stat.st_mtime,
-                )
+                ))
                 count_untracked_files += 1
-            yield media_file
+            asset = self.cache.add_asset(dirpath, basename, list(tracked_files.values()), new_files_params)
+            yield asset
         logger.debug(f"Scanned {count_scanned_files} files: {count_tracked_files} tracked, {count_untracked_files} untracked")
         
 
@@ -68,44 +72,53 @@ class Importer:
         exclude_after: datetime=None,
         overwrite: bool=False,
         force_all: bool=False,
+        pack_below: int=None,
+        hash_type: str=DEFAULT_HASH_TYPE,
     ):
         logger.info(f"Will import to directory: {target_directory}")
+        if pack_below:
+            logger.info(f"Files smaller than {pack_below} bytes will be packed into a container per directory")
+            self.copy_service.pack_below = pack_below
+        logger.debug(f"Hash type: {hash_type}")
+        self.copy_service.hash_type = hash_type
         if use_cache:
-            logger.debug(f"Getting tracked unimported files from cache...")
-            files = partial(self.cache.get_files_pending, force_all)
+            logger.debug(f"Getting tracked unimported assets from cache...")
+            assets = partial(self.cache.get_assets_pending, force_all)
         else:
             logger.debug(f"Will perform device filesystem scan...")
-            files = partial(self.scan, device)
-        pbar_import = tqdm(desc='Will import', unit=' files')
-        pbar_skipping_exists = tqdm(desc='Will skip (already on disk)', unit=' files')
-        for media_file in files():
-            # Test all provided filters
+            assets = partial(self.scan, device)
+        pbar_import = tqdm(desc='Will import', unit=' assets')
+        pbar_skipping_exists = tqdm(desc='Will skip (already on disk)', unit=' assets')
+        for asset in assets():
+            # Test all provided filters against the primary file, e.g. the HEIC of a Live Photo
+            primary = asset.primary
             filter_was_triggered = False
             for exclude_filter in exclude_filters:
-                filter_result = exclude_filter.test_filter(media_file)
+                filter_result = exclude_filter.test_filter(primary)
                 if filter_result.result is False:
                     filter_was_triggered = True
-                    logger.debug(f"Matches exclude filter [{exclude_filter}: {exclude_filter.compare_value}] | File: {media_file.filepath_src} | {filter_result.get_test_results_as_str()}")
+                    logger.debug(f"Matches exclude filter [{exclude_filter}: {exclude_filter.compare_value}] | File: {primary.filepath_src} | {filter_result.get_test_results_as_str()}")
                     break
             if filter_was_triggered:
                 continue
             # Test files already on disk
             if overwrite:
                 logger.info("Overwrite is ON: all files eligible for import will be copied by overwriting existing files on disk")
+                media_files = list(asset.files)
             else:
-                # Establish destination filepath
-                filepath_dst = Path(target_directory) / Path(media_file.filepath_src)
-                if filepath_dst.is_file():
-                    logger.debug(f"File exists, skipping: {filepath_dst}")
+                # Pull only the files of the asset missing from disk, never touching existing ones
+                media_files = [ media_file for media_file in asset.files if not self.is_file_on_disk(media_file, target_directory) ]
+                if not media_files:
+                    logger.debug(f"Asset exists, skipping: {asset.dirpath_src}/{asset.basename}")
                     pbar_skipping_exists.update(1)
                     continue
             # Add to the copy queue
-            await self.copy_service.queue.put( (device, media_file, target_directory) )
+            await self.copy_service.queue.put( (device, asset, target_directory, media_files) )
             logger.debug("Added to copy queue")
             pbar_import.update(1)
         logger.debug(f"Queue counts | Copy: {self.copy_service.queue.qsize()} | Verify: {self.verify_service.queue.qsize()}")
-        pbar_copy = ProgressBar(name='Copying', unit=' files', total=self.copy_service.queue.qsize())
-        pbar_verify = ProgressBar(name='Verifying', unit=' files')
+        pbar_copy = ProgressBar(name='Copying', unit=' assets', total=self.copy_service.queue.qsize())
+        pbar_verify = ProgressBar(name='Verifying', unit=' assets')
         # Create ongoing tasks
         await asyncio.gather(
             self.copy_service.process_queue(pbar_copy.update),
@@ -115,4 +128,20 @@ class Importer:
         pbar_verify.total = self.verify_service.queue.qsize()
         # Watch for queue items
         await self.copy_service.queue.join()
-        await self.verify_service.queue.join()
\ No newline at end of file
+        await self.verify_service.queue.join()
+
+    def is_file_on_disk(self, media_file: TrackedMediaFile, target_directory: str) -> bool:
+        # Already stored within a pack
+        if media_file.status_imported and media_file.pack_offset is not None:
+            if is_pack_member_on_disk(media_file.filepath_dst, media_file.pack_offset, media_file.size):
+                logger.debug(f"File exists in pack: {media_file.filepath_dst} @ {media_file.pack_offset}")
+                return True
+        # Establish destination filepath
+        filepath_dst = Path(target_directory) / Path(media_file.filepath_src)
+        if filepath_dst.is_file():
+            # A file never imported only counts if it matches, otherwise it may be left over from a failed pull
+            if media_file.status_imported or filepath_dst.stat().st_size == media_file.size:
+                logger.debug(f"File exists: {filepath_dst}")
+                return True
+            logger.warning(f"File exists but was not imported and its size does not match, will pull again: {filepath_dst}")
+        return False
@@ -0,0 +1,133 @@
+from pathlib import Path
+from typing import BinaryIO, Generator
+import logging
+import tarfile
+
+logger = logging.getLogger(__name__)
+
+PACK_FILENAME = '.archivuelo.pack'
+
+
+class Pack:
+    """
+    Container for small files, one per destination directory.
+
+    A pack is a plain tar archive, so every member carries its own name, size and mtime,
+    and can be extracted with `archivuelo extract` or any tar tool without the cache.
+    The cache keeps each member's data offset (TrackedMediaFile.pack_offset) as a fast index.
+    """
+
+    def __init__(self, dirpath: Path):
+        self.filepath = Path(dirpath) / PACK_FILENAME
+        try:
+            self.tar = tarfile.open(self.filepath, 'a')
+        except tarfile.ReadError:
+            # Left incomplete by an interrupted run
+            self._truncate_to_last_complete_member()
+            self.tar = tarfile.open(self.filepath, 'a')
+
+    def _truncate_to_last_complete_member(self):
+        filesize = self.filepath.stat().st_size
+        end = 0
+        try:
+            with tarfile.open(self.filepath, 'r') as tar:
+                for member in tar:
+                    member_end = member.offset_data + get_padded_size(member.size)
+                    if member_end > filesize:
+                        break
+                    end = member_end
+        except tarfile.ReadError:
+            pass
+        logger.warning(f"Pack was incomplete, truncating to last complete member: {self.filepath} ({filesize} -> {end} bytes)")
+        with open(self.filepath, 'r+b') as f:
+            f.truncate(end)
+            # End-of-archive marker, so the pack can be opened for appending again
+            f.seek(end)
+            f.write(tarfile.NUL * tarfile.BLOCKSIZE * 2)
+
+    def add(self, name: str, fileobj: BinaryIO, size: int, mtime: float) -> int:
+        """
+        Append a member and flush it to disk, returns the offset of its data within the pack
+        """
+        tarinfo = tarfile.TarInfo(name)
+        tarinfo.size = size
+        tarinfo.mtime = int(mtime)
+        self.tar.addfile(tarinfo, fileobj)
+        self.tar.fileobj.flush()
+        # After addfile(), tar.offset sits at the end of the member's padded data
+        return self.tar.offset - get_padded_size(size)
+
+    def tell(self) -> int:
+        """Length of the pack's members, i.e. where the next member will be appended"""
+        return self.tar.offset
+
+    def truncate(self, length: int):
+        """Discard members appended after length, e.g. those of an asset that failed to pull"""
+        logger.debug(f"Truncating pack: {self.filepath} ({self.tar.offset} -> {length} bytes)")
+        self.tar.fileobj.seek(length)
+        self.tar.fileobj.truncate()
+        self.tar.fileobj.flush()
+        self.tar.offset = length
+        self.tar.members = [ member for member in self.tar.members if member.offset < length ]
+
+    def close(self):
+        self.tar.close()
+
+    @property
+    def name(self) -> str:
+        return str(self.filepath)
+
+
+class PackPool:
+    """Keep one open Pack per destination directory for the duration of an import"""
+
+    def __init__(self):
+        self.packs = {}
+
+    def get(self, dirpath: Path) -> Pack:
+        key = str(dirpath)
+        if key not in self.packs:
+            logger.debug(f"Opening pack in: {dirpath}")
+            self.packs[key] = Pack(dirpath)
+        return self.packs[key]
+
+    def close(self):
+        for pack in self.packs.values():
+            pack.close()
+        self.packs = {}
+
+
+def get_padded_size(size: int) -> int:
+    """Size of member data within a tar, padded to whole blocks"""
+    blocks, remainder = divmod(size, tarfile.BLOCKSIZE)
+    return (blocks + bool(remainder)) * tarfile.BLOCKSIZE
+
+
+def is_pack_member_on_disk(filepath: str, offset: int, size: int) -> bool:
+    """Check the pack exists and is long enough to hold this member"""
+    filepath = Path(filepath)
+    return filepath.is_file() and filepath.stat().st_size >= offset + size
+
+
+def read_pack_member(filepath: str, offset: int, size: int, chunk_size: int) -> Generator[bytes, None, None]:
+    """Seek into a pack and yield the member's contents in chunks"""
+    with open(filepath, 'rb') as f:
+        f.seek(offset)
+        left_size = size
+        while left_size > 0:
+            chunk = f.read(min(chunk_size, left_size))
+            if not chunk:
+                break
+            yield chunk
+            left_size -= len(chunk)
+
+
+def extract_pack(filepath: str, target_directory: str, member_name: str=None) -> list:
+    """
+    Extract all members of a pack, or only member_name, returns the names extracted.
+    Where a name was packed more than once, the last (most recent) copy wins.
+    """
+    with tarfile.open(filepath, 'r') as tar:
+        members = [ member for member in tar.getmembers() if member_name is None or member.name == member_name ]
+        tar.extractall(target_directory, members=members, filter='data')
+    return [ member.name for member in members ]
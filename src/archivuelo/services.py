@@ -1,16 +1,20 @@
-from .cache import Cache, TrackedMediaFile
+from .cache import Cache, TrackedAsset, TrackedMediaFile
 from .device import Device
+from .hashing import DEFAULT_HASH_TYPE, is_supported, new_hasher
+from .pack import PackPool, is_pack_member_on_disk, read_pack_member
 from datetime import datetime
 from pathlib import Path
 from functools import partial
 import asyncio
 import logging
+import os
 from tqdm.asyncio import tqdm
-import xxhash
+from typing import List
 
 logger = logging.getLogger(__name__)
 
-VERIFICATION_CHUNK_SIZE = 8192
+VERIFICATION_CHUNK_SIZE = 1024 * 1024
+PARTIAL_SUFFIX = '.archivuelo-partial'
 
 
 class CopyService:
@@ -18,51 +22,113 @@ class CopyService:
         self.cache: Cache = cache
         self.queue = asyncio.Queue()
         self.verify_queue: asyncio.Queue = None
+        # Files smaller than this (bytes) are appended to a per-directory pack, if defined
+        self.pack_below: int = None
+        self.hash_type: str = DEFAULT_HASH_TYPE
+        self.packs = PackPool()
 
     async def process_queue(self, progress_callback, verify_files_after: bool=True):
         while not self.queue.empty():
-            device, media_file, target_directory = await self.queue.get()
-            progress_callback(0, media_file.filepath_src)
-            result, media_file = self.copy_file_from_device(device, media_file, target_directory)
-            # Issue with copy
+            device, asset, target_directory, media_files = await self.queue.get()
+            progress_callback(0, asset.primary.filepath_src)
+            result, asset = self.copy_asset_from_device(device, asset, target_directory, media_files)
+            progress_callback(1)
+            # Issue with copy, nothing was committed for this asset
             if not result:
-                logger.error(f"Pull file unsucessful: {media_file.filepath_src}")
+                logger.error(f"Pull asset unsucessful: {asset.dirpath_src}/{asset.basename}")
                 self.queue.task_done()
-            progress_callback(1)
+                continue
             # Add to verify queue
             if verify_files_after and self.verify_queue:
-                logger.debug(f"Added file to verify queue: {media_file.filepath_src}")
-                await self.verify_queue.put(media_file)
-            # Update the tracked file
+                logger.debug(f"Added asset to verify queue: {asset.dirpath_src}/{asset.basename}")
+                await self.verify_queue.put(asset)
             self.queue.task_done()
+        self.packs.close()
+
+    def copy_asset_from_device(self, device: Device, asset: TrackedAsset, target_directory: str, media_files: List[TrackedMediaFile]):
+        """
+        Pull the given files of an asset back-to-back, then move them into place and update db for all of them
+        in one transaction. If any pull fails, nothing of the asset is left on disk: partial files are removed
+        and packs are truncated back to their length before the asset.
+        param media_files: the files missing from disk, or all files of the asset when overwriting
+        """
+        staged = []
+        packs = {}
+        for media_file in media_files:
+            dirpath_dst = self.get_dirpath_dst(media_file, target_directory)
+            if self.is_packed(media_file):
+                pack = self.packs.get(dirpath_dst)
+                packs.setdefault(pack.name, (pack, pack.tell()))
+            else:
+                staged.append(( get_filepath_partial(dirpath_dst / media_file.filename), media_file ))
+            result, media_file = self.copy_file_from_device(device, media_file, target_directory)
+            if not result:
+                for filepath_partial, _ in staged:
+                    filepath_partial.unlink(missing_ok=True)
+                for pack, length in packs.values():
+                    pack.truncate(length)
+                return (False, asset)
+        for filepath_partial, media_file in staged:
+            os.replace(filepath_partial, media_file.filepath_dst)
+        # Update the tracked files
+        self.cache.save_files(media_files)
+        return (True, asset)
 
     def copy_file_from_device(self, device: Device, media_file, target_directory: str, progress_callback=None):
         """
-        Perform the pull and update db afterwards
+        Perform the pull and update the tracked file, which is saved with its asset.
+        Files not packed are pulled to a partial file, moved into place once the whole asset is pulled.
         """
-        def _on_pull_complete(media_file: TrackedMediaFile, src: str, dest: str, hash: str):
+        def _on_pull_complete(media_file: TrackedMediaFile, src: str, dest: str, hash: str, offset: int=None, size: int=None):
             """
             param media_file: TrackedMediaFile
-            param src, dest, hash: from afc.pull() callback
+            param src, dest, hash, size: from afc.pull() callback
+            param offset: from afc.pull_into() callback, position of the file's data within a pack
             """
             media_file.filepath_dst = dest
+            media_file.pack_offset = offset
+            # Bytes actually pulled, which verify relies on: the file may have changed since scan (e.g. an edited .AAE)
+            if size is not None:
+                media_file.size = size
             media_file.hash_type = hash['type']
             media_file.hash_value = hash['value']
             media_file.status_imported = True
             media_file.time_imported = datetime.now()
-            media_file.save()
 
-        filepath_parent = Path(media_file.filepath_src).parent
-        dirpath_dst = Path(target_directory) / filepath_parent
+        dirpath_dst = self.get_dirpath_dst(media_file, target_directory)
         # Ensure location exists
         dirpath_dst.mkdir(parents=True, exist_ok=True)
+        if self.is_packed(media_file):
+            result = device.pull_file_into_pack(
+                media_file.filepath_src,
+                self.packs.get(dirpath_dst),
+                partial(_on_pull_complete, media_file),
+                hash_type=self.hash_type,
+            )
+            return (result, media_file)
+        filepath_dst = dirpath_dst / media_file.filename
         result = device.pull_file(
             media_file.filepath_src,
-            dirpath_dst,
+            str(get_filepath_partial(filepath_dst)),
             partial(_on_pull_complete, media_file),
+            hash_type=self.hash_type,
         )
+        if result:
+            media_file.filepath_dst = str(filepath_dst)
         return (result, media_file)
 
+    def get_dirpath_dst(self, media_file: TrackedMediaFile, target_directory: str) -> Path:
+        filepath_parent = Path(media_file.filepath_src).parent
+        return Path(target_directory) / filepath_parent
+
+    def is_packed(self, media_file: TrackedMediaFile) -> bool:
+        return bool(self.pack_below) and media_file.size < self.pack_below
+
+
+def get_filepath_partial(filepath_dst: Path) -> Path:
+    """Hidden sibling a file is pulled to, so it never appears under its own name until complete"""
+    return filepath_dst.with_name(f".{filepath_dst.name}{PARTIAL_SUFFIX}")
+
 
 class VerifyService:
     def __init__(self, cache):
@@ -73,12 +139,20 @@ class VerifyService:
     async def process_queue(self, progress_callback):
         logger.debug("Starting...")
         while not self.copy_queue.empty() or not self.queue.empty():
-            media_file = await self.queue.get()
-            progress_callback(0, media_file.filepath_dst)
-            file_is_verified = self.verify_file_on_disk(media_file)
+            asset = await self.queue.get()
+            progress_callback(0, asset.primary.filepath_dst)
+            asset_is_verified = self.verify_asset_on_disk(asset)
             self.queue.task_done()
             progress_callback(1)
         logger.debug("End")
+
+    def verify_asset_on_disk(self, asset: TrackedAsset) -> bool:
+        """
+        Check every imported file of an asset, reporting all failures rather than stopping at the first.
+        Files already on disk but never imported (e.g. a name collision) have no hash to check against.
+        """
+        results = [ self.verify_file_on_disk(media_file) for media_file in asset.files if media_file.status_imported ]
+        return all(results)
     
     def verify_file_on_disk(self, media_file) -> bool:
         """
@@ -87,15 +161,17 @@ class VerifyService:
         if not media_file.hash_value:
             logger.error(f'Verify: No hash value found for this media file: {media_file.filepath_src}')
             return False
-        if not media_file.hash_type == 'xxh3_64':
-            logger.error(f"Verify: Unrecognised hash type ({media_file.get('hash_type')}) for this media file, can't verify: {media_file.filepath_src}")
+        if not is_supported(media_file.hash_type):
+            logger.error(f"Verify: Unrecognised hash type ({media_file.hash_type}) for this media file, can't verify: {media_file.filepath_src}")
             return False
+        if media_file.pack_offset is not None:
+            return self.verify_pack_member_on_disk(media_file)
         if not Path(media_file.filepath_dst).is_file():
             logger.error(f'Verify: No file found at this path: {media_file.filepath_dst}')
             return False
         logger.debug(f'Verifying {media_file.filepath_dst} | Source hash: {media_file.hash_value} ({media_file.hash_type})')
         with open(media_file.filepath_dst, 'rb') as fbytes:
-            dst_hasher = xxhash.xxh3_64()
+            dst_hasher = new_hasher(media_file.hash_type, media_file.size)
             while chunk := fbytes.read(VERIFICATION_CHUNK_SIZE):
                 dst_hasher.update(chunk)
             dst_hash = dst_hasher.hexdigest()
@@ -106,4 +182,23 @@ class VerifyService:
                 logger.error(f'Verify: Hash mismatch for file {media_file.filepath_dst} - Source: {media_file.hash_value} - Destination: {dst_hash}')
                 filesize_dst = Path(media_file.filepath_dst).stat().st_size
                 logger.error(f'Verify: Destination filesize (bytes): {media_file.filepath_dst}')
-                return False
\ No newline at end of file
+                return False
+
+    def verify_pack_member_on_disk(self, media_file) -> bool:
+        """
+        Check file stored within a pack against src hash, by seeking to its offset
+        """
+        if not is_pack_member_on_disk(media_file.filepath_dst, media_file.pack_offset, media_file.size):
+            logger.error(f'Verify: Pack missing or too short to hold this file: {media_file.filepath_dst} (offset {media_file.pack_offset}, size {media_file.size})')
+            return False
+        logger.debug(f'Verifying {media_file.filepath_src} in pack {media_file.filepath_dst} @ {media_file.pack_offset} | Source hash: {media_file.hash_value} ({media_file.hash_type})')
+        dst_hasher = new_hasher(media_file.hash_type, media_file.size)
+        for chunk in read_pack_member(media_file.filepath_dst, media_file.pack_offset, media_file.size, VERIFICATION_CHUNK_SIZE):
+            dst_hasher.update(chunk)
+        dst_hash = dst_hasher.hexdigest()
+        if media_file.hash_value == dst_hash:
+            logger.debug(f'Verified match')
+            return True
+        else:
+            logger.error(f'Verify: Hash mismatch for file {media_file.filepath_src} in pack {media_file.filepath_dst} - Source: {media_file.hash_value} - Destination: {dst_hash}')
+            return False
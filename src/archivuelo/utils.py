@@ -1,4 +1,12 @@
 from tqdm.asyncio import tqdm
+import posixpath
+
+# Within an asset, the primary file is the first match in this order, e.g. the HEIC of a Live Photo
+# Anything not listed (sidecars such as .AAE) ranks last
+ASSET_PRIMARY_EXTENSIONS = [
+    '.heic', '.jpg', '.jpeg', '.png', '.dng', '.gif', '.tif', '.tiff', '.webp',
+    '.mov', '.mp4', '.m4v',
+]
 
 class ProgressBar():
     """
@@ -21,4 +29,16 @@ class ProgressBar():
             # If only item_name is being updated with 0 progress, don't call tqdm.update()
             self.bar.update(n)
         if item_name:
-            self.bar_current_item.set_description_str(item_name)
\ No newline at end of file
+            self.bar_current_item.set_description_str(item_name)
+
+
+def get_asset_basename(filepath: str) -> str:
+    """Files sharing a basename within a directory belong to the same asset, e.g. IMG_0001.HEIC, IMG_0001.MOV, IMG_0001.AAE"""
+    return posixpath.splitext(posixpath.basename(filepath))[0]
+
+
+def get_asset_primary_rank(filename: str) -> int:
+    ext = posixpath.splitext(filename)[1].lower()
+    if ext in ASSET_PRIMARY_EXTENSIONS:
+        return ASSET_PRIMARY_EXTENSIONS.index(ext)
+    return len(ASSET_PRIMARY_EXTENSIONS)